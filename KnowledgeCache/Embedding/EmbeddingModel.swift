@@ -3,8 +3,8 @@
 //  KnowledgeCache
 //
 //  Core ML wrapper for all-MiniLM-L6-v2.
-//  Input: input_ids, attention_mask (Int32, shape 1×maxLength)
-//  Output: embedding Float32[384]. L2-normalized. Deterministic.
+//  Input: input_ids, attention_mask (Int32, shape B×L; fixed or one of the exported enumerated (batch, length) shapes)
+//  Output: embedding Float32[B, 384]. L2-normalized per row. Deterministic.
 //
 
 import Foundation
@@ -31,6 +31,9 @@ final class EmbeddingModel {
     private var model: MLModel?
     private let dimension: Int
     private let maxLength: Int
+    /// (batch, length) input shapes the model accepts. One entry for fixed-shape exports.
+    private let inputShapes: [(batch: Int, length: Int)]
+    private let maxBatch: Int
 
     /// Fallback: locate EmbeddingModel.mlpackage by path in the bundle (directory resources may not resolve via forResource:withExtension:).
     private static func findEmbeddingModelInBundle(_ bundle: Bundle) -> URL? {
@@ -94,7 +97,14 @@ final class EmbeddingModel {
         guard idShape.count >= 2, maskShape.count >= 2 else {
             throw EmbeddingModelError.invalidInputOutput("input_ids and attention_mask must be 2D")
         }
-        self.maxLength = idShape.last ?? MiniLMTokenizer.maxLength
+        // Enumerated-shape exports report the default shape in `shape`; collect every allowed (batch, length) instead.
+        let enumerated = (inIds.multiArrayConstraint?.shapeConstraint.enumeratedShapes ?? [])
+            .map { $0.map { $0.intValue } }
+            .filter { $0.count >= 2 }
+        let shapes = enumerated.isEmpty ? [idShape] : enumerated
+        self.inputShapes = shapes.map { (batch: $0[$0.count - 2], length: $0[$0.count - 1]) }
+        self.maxLength = inputShapes.map(\.length).max() ?? MiniLMTokenizer.maxLength
+        self.maxBatch = inputShapes.map(\.batch).max() ?? 1
 
         // Accept "embedding" or first output (e.g. var_575 from neuralnetwork export)
         let outDesc = desc.outputDescriptionsByName["embedding"] ?? desc.outputDescriptionsByName.values.first
@@ -124,15 +134,48 @@ final class EmbeddingModel {
     var embeddingDimension: Int { dimension }
     var sequenceLength: Int { maxLength }
 
-    /// Embed from token IDs (length must be maxLength). Returns L2-normalized vector. Deterministic.
+    /// Largest number of sequences one prediction accepts (1 for single-batch exports).
+    var maxBatchSize: Int { maxBatch }
+
+    /// Smallest accepted (batch, length) shape holding `rows` sequences of `tokenCount` real tokens.
+    private func inputShape(rows: Int, tokenCount: Int) -> (batch: Int, length: Int) {
+        inputShapes
+            .filter { $0.batch >= rows && $0.length >= tokenCount }
+            .min { ($0.batch * $0.length, $0.length) < ($1.batch * $1.length, $1.length) }
+            ?? (batch: maxBatch, length: maxLength)
+    }
+
+    /// Embed from token IDs (trailing padding is trimmed to the smallest bucket). Returns L2-normalized vector. Deterministic.
     func embed(inputIds: [Int32], attentionMask: [Int32]) throws -> [Float] {
+        guard let vec = try embed(batch: [(inputIds, attentionMask)]).first else {
+            throw EmbeddingModelError.predictionFailed("no embedding output")
+        }
+        return vec
+    }
+
+    /// Embed up to maxBatchSize token sequences in one prediction, padded to the smallest accepted (batch, length)
+    /// shape. Padding rows have an all-zero mask and are dropped. Returns one L2-normalized vector per input row.
+    func embed(batch: [(inputIds: [Int32], attentionMask: [Int32])]) throws -> [[Float]] {
         guard let model = model else { throw EmbeddingModelError.modelNotFound }
-        let len = min(inputIds.count, maxLength)
-        let idsArray = try MLMultiArray(shape: [1, NSNumber(value: maxLength)], dataType: .int32)
-        let maskArray = try MLMultiArray(shape: [1, NSNumber(value: maxLength)], dataType: .int32)
-        for i in 0..<maxLength {
-            idsArray[[0, i] as [NSNumber]] = NSNumber(value: i < len ? inputIds[i] : 0)
-            maskArray[[0, i] as [NSNumber]] = NSNumber(value: i < len ? attentionMask[i] : 0)
+        guard !batch.isEmpty else { return [] }
+        guard batch.count <= maxBatch else {
+            throw EmbeddingModelError.invalidInputOutput("batch of \(batch.count) exceeds model max batch \(maxBatch)")
+        }
+        let lengths = batch.map { min($0.inputIds.count, $0.attentionMask.count, maxLength) }
+        let realTokens = zip(batch, lengths).map { row, len in
+            row.attentionMask.prefix(len).lastIndex { $0 != 0 }.map { $0 + 1 } ?? 0
+        }
+        let shape = inputShape(rows: batch.count, tokenCount: realTokens.max() ?? 0)
+        let arrayShape = [NSNumber(value: shape.batch), NSNumber(value: shape.length)]
+        let idsArray = try MLMultiArray(shape: arrayShape, dataType: .int32)
+        let maskArray = try MLMultiArray(shape: arrayShape, dataType: .int32)
+        for r in 0..<shape.batch {
+            let len = r < batch.count ? lengths[r] : 0
+            for i in 0..<shape.length {
+                let key = [NSNumber(value: r), NSNumber(value: i)]
+                idsArray[key] = NSNumber(value: i < len ? batch[r].inputIds[i] : 0)
+                maskArray[key] = NSNumber(value: i < len ? batch[r].attentionMask[i] : 0)
+            }
         }
         let inputs: [String: Any] = [
             "input_ids": idsArray,
@@ -150,11 +193,22 @@ final class EmbeddingModel {
         } else {
             throw EmbeddingModelError.predictionFailed("no embedding output")
         }
-        var vec = [Float](repeating: 0, count: embedding.count)
-        for i in 0..<embedding.count {
-            vec[i] = embedding[i].floatValue
+        // Non-2D output only comes from single-batch exports: the whole array is the one row.
+        guard embedding.shape.count == 2 else {
+            var vec = [Float](repeating: 0, count: embedding.count)
+            for i in 0..<embedding.count {
+                vec[i] = embedding[i].floatValue
+            }
+            return [Self.l2Normalize(vec)]
+        }
+        let dim = embedding.shape[embedding.shape.count - 1].intValue
+        return (0..<batch.count).map { r in
+            var vec = [Float](repeating: 0, count: dim)
+            for j in 0..<dim {
+                vec[j] = embedding[[NSNumber(value: r), NSNumber(value: j)]].floatValue
+            }
+            return Self.l2Normalize(vec)
         }
-        return Self.l2Normalize(vec)
     }
 
     static func l2Normalize(_ v: [Float]) -> [Float] {
@@ -20,7 +20,7 @@ final class EmbeddingService: EmbeddingProviding, @unchecked Sendable {
     private var loadedModel: EmbeddingModel?
     private var modelLoadAttempted = false
 
-    init(vocabResource: String = "minilm_vocab", modelName: String = "EmbeddingModel", batchSize: Int = 5) {
+    init(vocabResource: String = "minilm_vocab", modelName: String = "EmbeddingModel", batchSize: Int = 32) {
         self.tokenizer = MiniLMTokenizer(vocabResource: vocabResource, extension: "txt", bundle: .main)
         if tokenizer == nil {
             AppLogger.error("EmbeddingService: MiniLMTokenizer failed to load (vocab: \(vocabResource).txt)")
@@ -42,16 +42,27 @@ final class EmbeddingService: EmbeddingProviding, @unchecked Sendable {
         return try? model.embed(inputIds: ids, attentionMask: mask)
     }
 
-    /// Embed multiple texts. Progress: (current, total). Deterministic.
+    /// Embed multiple texts, up to batchSize per prediction (capped by the model's max batch). Progress: (current, total). Deterministic.
     func embed(texts: [String], progress: ((Int, Int) -> Void)? = nil) -> [[Float]] {
         guard let tokenizer = tokenizer, let model = model() else { return [] }
+        let step = max(1, min(batchSize, model.maxBatchSize))
         var results: [[Float]] = []
-        for (i, text) in texts.enumerated() {
-            let (ids, mask) = tokenizer.encode(text)
-            if ids.count == MiniLMTokenizer.maxLength, let vec = try? model.embed(inputIds: ids, attentionMask: mask) {
-                results.append(vec)
+        var start = 0
+        while start < texts.count {
+            let end = min(start + step, texts.count)
+            let encoded = texts[start..<end]
+                .map { tokenizer.encode($0) }
+                .filter { $0.inputIds.count == MiniLMTokenizer.maxLength }
+            if let vecs = try? model.embed(batch: encoded) {
+                results.append(contentsOf: vecs)
+            } else {
+                // Batch prediction failed: fall back to one prediction per text so one bad row does not drop the rest.
+                results.append(contentsOf: encoded.compactMap { try? model.embed(inputIds: $0.inputIds, attentionMask: $0.attentionMask) })
             }
-            progress?(i + 1, texts.count)
+            for i in start..<end {
+                progress?(i + 1, texts.count)
+            }
+            start = end
         }
         return results
     }
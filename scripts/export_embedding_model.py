@@ -3,100 +3,293 @@
 Export sentence-transformers/all-MiniLM-L6-v2 to Core ML for KnowledgeCache.
 
 Output:
-  - EmbeddingModel.mlmodel (input_ids, attention_mask -> embedding Float32[384])
+  - EmbeddingModel.mlmodelc (precompiled copy of the model below; the build phase bundles it when present)
+  - EmbeddingModel.mlpackage (mlprogram, FP16; input_ids, attention_mask [B, L] -> embedding Float32[B, 384])
+    or EmbeddingModel.mlmodel with --nn (legacy FP32 neuralnetwork)
   - minilm_vocab.txt (one token per line, index = line number for Swift tokenizer)
 
 Usage (from repo root, with venv activated):
   python scripts/export_embedding_model.py
+  python scripts/export_embedding_model.py --quantize int8   # int8 weights (~half size)
+  python scripts/export_embedding_model.py --quantize int4   # 4-bit palettized weights
+  python scripts/export_embedding_model.py --nn              # legacy FP32 neuralnetwork .mlmodel
+  python scripts/export_embedding_model.py --split-buckets   # EmbeddingModel_{64,128,256}, converted in parallel
+  python scripts/export_embedding_model.py --multifunction   # + EmbeddingModelMultiFunction (encode, mean_pool)
+
+Inputs are exported with enumerated (batch, length) shapes: batch 1, 8, 32 x length 64, 128, 256 (up to
+--max-length). The Swift side (EmbeddingModel) pads each call to the smallest exported shape that fits its
+texts and their real tokens, so short texts do not pay O(L²) attention over 256 padded positions and
+EmbeddingService packs up to 32 texts into one predict() call.
 
 Requires: pip install -r scripts/requirements-export.txt
+  (--multifunction needs coremltools 8: pip install -r scripts/requirements-export-multifunction.txt instead)
 Python 3.9–3.11 strongly recommended (Python 3.14 + coremltools 9 may fail conversion).
 """
 
+import argparse
 import os
 import shutil
+import subprocess
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from types import SimpleNamespace
 
-import numpy as np
-import torch
-import coremltools as ct
-from transformers import AutoTokenizer, AutoModel
+# torch, coremltools, transformers and numpy are imported where used: importing them costs seconds,
+# and --help, argument errors and `import export_embedding_model` should not pay for it.
 
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 MAX_LENGTH = 256
+HIDDEN_SIZE = 384
+# MiniLM's position embeddings cover 512 tokens; --max-length beyond that cannot be traced.
+MAX_POSITION_EMBEDDINGS = 512
+# Sequence-length buckets exported as enumerated shapes; Core ML specializes kernels per bucket.
+SEQUENCE_BUCKETS = (64, 128, 256)
+DEFAULT_SEQUENCE_BUCKET = 128
+# Batch sizes exported alongside each length; Swift packs up to 32 texts into one predict() call.
+BATCH_BUCKETS = (1, 8, 32)
 REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 OUTPUT_MLPACKAGE = os.path.join(REPO_ROOT, "KnowledgeCache", "EmbeddingModel.mlpackage")
 OUTPUT_MLMODEL = os.path.join(REPO_ROOT, "KnowledgeCache", "EmbeddingModel.mlmodel")
+OUTPUT_MLMODELC = os.path.join(REPO_ROOT, "KnowledgeCache", "EmbeddingModel.mlmodelc")
+OUTPUT_MULTIFUNCTION = os.path.join(REPO_ROOT, "KnowledgeCache", "EmbeddingModelMultiFunction.mlpackage")
 OUTPUT_VOCAB = os.path.join(REPO_ROOT, "KnowledgeCache", "Resources", "minilm_vocab.txt")
 
 
-class MiniLMEmbeddingModel(torch.nn.Module):
-    def __init__(self):
-        super().__init__()
-        self.model = AutoModel.from_pretrained(MODEL_NAME)
+@lru_cache(maxsize=None)
+def torch_modules():
+    """Define the torch modules on first use (they subclass torch.nn.Module, so they cannot live at module level)."""
+    import torch
+    from transformers import AutoModel
 
-    def forward(self, input_ids, attention_mask):
-        outputs = self.model(
-            input_ids=input_ids,
-            attention_mask=attention_mask,
-        )
-        token_embeddings = outputs.last_hidden_state
-        mask = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
-        summed = torch.sum(token_embeddings * mask, dim=1)
-        counts = torch.clamp(mask.sum(dim=1), min=1e-9)
-        mean_pooled = summed / counts
-        return mean_pooled
+    class MeanPool(torch.nn.Module):
+        """Masked mean over the sequence axis: hidden states [B, L, 384] + attention_mask [B, L] -> [B, 384]."""
+
+        def forward(self, token_embeddings, attention_mask):
+            # Mean pool over real tokens. [B, L, 1] mask broadcasts in the multiply; no expand() to [B, L, 384].
+            mask = attention_mask.unsqueeze(-1).to(token_embeddings.dtype)
+            summed = (token_embeddings * mask).sum(dim=1)
+            counts = mask.sum(dim=1).clamp(min=1)
+            return summed / counts
+
+    class MiniLMEncoder(torch.nn.Module):
+        """Encoder only (for --multifunction): input_ids, attention_mask -> last_hidden_state [B, L, 384]."""
+
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+    class MiniLMEmbeddingModel(torch.nn.Module):
+        def __init__(self, local_files_only=False, torch_dtype=torch.float32):
+            super().__init__()
+            self.model = AutoModel.from_pretrained(
+                MODEL_NAME, local_files_only=local_files_only, torch_dtype=torch_dtype
+            )
+            self.pool = MeanPool()
+
+        def forward(self, input_ids, attention_mask):
+            outputs = self.model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+            )
+            return self.pool(outputs.last_hidden_state, attention_mask)
+
+    return SimpleNamespace(MeanPool=MeanPool, MiniLMEncoder=MiniLMEncoder, MiniLMEmbeddingModel=MiniLMEmbeddingModel)
 
 
 def export_vocab(tokenizer):
     """Export vocabulary: one token per line, index = line number (for Swift MiniLMTokenizer)."""
-    vocab = tokenizer.get_vocab()
-    sorted_items = sorted(vocab.items(), key=lambda x: x[1])
     os.makedirs(os.path.dirname(OUTPUT_VOCAB), exist_ok=True)
-    with open(OUTPUT_VOCAB, "w", encoding="utf-8") as f:
-        for token, _ in sorted_items:
-            f.write(token + "\n")
-    print(f"✅ Saved vocabulary ({len(sorted_items)} tokens) to {OUTPUT_VOCAB}")
+    # BERT WordPiece tokenizers keep vocab.txt in the Hugging Face cache already in this format: copy it as is.
+    # from_pretrained records the resolved cache path in init_kwargs; BertTokenizerFast has no vocab_file attribute.
+    src = tokenizer.init_kwargs.get("vocab_file") or getattr(tokenizer, "vocab_file", None)
+    if src and os.path.isfile(src):
+        shutil.copyfile(src, OUTPUT_VOCAB)
+        print(f"✅ Copied vocabulary ({len(tokenizer)} tokens) from {src} to {OUTPUT_VOCAB}")
+        return
+    # WordPiece ids are contiguous 0..N-1, so id order is line order: no dict walk or sort needed.
+    tokens = tokenizer.convert_ids_to_tokens(list(range(len(tokenizer))))
+    # Encode once and hand the bytes straight to the fd: no text-mode re-encoding or buffering layer.
+    payload = memoryview(("\n".join(tokens) + "\n").encode("utf-8"))
+    fd = os.open(OUTPUT_VOCAB, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        while payload:
+            payload = payload[os.write(fd, payload):]
+    finally:
+        os.close(fd)
+    print(f"✅ Saved vocabulary ({len(tokens)} tokens) to {OUTPUT_VOCAB}")
 
 
-def main():
-    print("Loading tokenizer and model...")
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-    model = MiniLMEmbeddingModel().eval()
-
-    tokens = tokenizer(
-        "This is a test sentence.",
-        padding="max_length",
-        truncation=True,
-        max_length=MAX_LENGTH,
-        return_tensors="pt",
+def compress_weights(mlmodel, quantize):
+    """Compress Core ML weights: int8 linear quantization or 4-bit k-means palettization."""
+    if quantize == "none":
+        return mlmodel
+    nbits = 8 if quantize == "int8" else 4
+    if mlmodel.get_spec().WhichOneof("Type") != "mlProgram":
+        # coremltools.optimize.coreml only handles mlprogram; neuralnetwork uses the legacy quantization utils.
+        from coremltools.models.neural_network import quantization_utils
+        mode = "linear_symmetric" if quantize == "int8" else "kmeans_lut"
+        return quantization_utils.quantize_weights(mlmodel, nbits=nbits, quantization_mode=mode)
+
+    from coremltools.optimize.coreml import (
+        OpLinearQuantizerConfig,
+        OpPalettizerConfig,
+        OptimizationConfig,
+        linear_quantize_weights,
+        palettize_weights,
     )
-    input_ids = tokens["input_ids"].to(torch.int32)
-    attention_mask = tokens["attention_mask"].to(torch.int32)
+    if quantize == "int8":
+        config = OptimizationConfig(
+            global_config=OpLinearQuantizerConfig(mode="linear_symmetric", dtype="int8", weight_threshold=512)
+        )
+        return linear_quantize_weights(mlmodel, config=config)
+    config = OptimizationConfig(global_config=OpPalettizerConfig(nbits=4, mode="kmeans", weight_threshold=512))
+    return palettize_weights(mlmodel, config=config)
 
-    # Always export vocab first (needed for Swift MiniLMTokenizer)
-    export_vocab(tokenizer)
 
-    # Export Core ML model (trace -> convert)
-    print("Tracing model...")
+def sequence_lengths(max_length):
+    """Exported sequence lengths: the standard buckets below max_length, plus max_length itself."""
+    return sorted({b for b in SEQUENCE_BUCKETS if b < max_length} | {max_length})
+
+
+def input_shapes(lengths, default_length):
+    """Input shape for ct.TensorType: every (batch, length) pair from BATCH_BUCKETS x lengths, default (1, default_length)."""
+    import coremltools as ct
+
+    return ct.EnumeratedShapes(
+        shapes=[(b, n) for b in BATCH_BUCKETS for n in lengths],
+        default=(1, default_length),
+    )
+
+
+def sequence_shapes(max_length):
+    """Input shape for ct.TensorType: enumerated (batch, L) shapes for L in the buckets up to max_length."""
+    lengths = sequence_lengths(max_length)
+    default = DEFAULT_SEQUENCE_BUCKET if DEFAULT_SEQUENCE_BUCKET in lengths else lengths[0]
+    return input_shapes(lengths, default)
+
+
+def load_dtype(args):
+    """FP16 weights for the FP16 mlprogram export (no FP32 copy for the converter to cast down), FP32 otherwise."""
+    import torch
+
+    return torch.float32 if args.nn or args.load_fp32 else torch.float16
+
+
+def trace_model(model, tokenizer, max_length):
+    """Trace on a padded example of max_length tokens and freeze. Exits on failure."""
+    import torch
+
+    # Frozen params: no grad metadata on traced constants, and freeze() treats them as plain weights.
+    model.requires_grad_(False)
+    print(f"Tracing model (max_length={max_length})...")
     try:
-        traced = torch.jit.trace(model, (input_ids, attention_mask))
+        # int32 ids/mask on purpose: the Neural Engine rejects int64 inputs.
+        # no_grad rather than inference_mode: inference tensors captured as trace constants break jit.freeze.
+        # check_trace re-runs the model and diffs graphs: slow and memory-hungry on CI, and we never retrace.
+        with torch.no_grad():
+            tokens = tokenizer(
+                "This is a test sentence.",
+                padding="max_length",
+                truncation=True,
+                max_length=max_length,
+                return_tensors="pt",
+            )
+            example = (tokens["input_ids"].to(torch.int32), tokens["attention_mask"].to(torch.int32))
+            try:
+                traced = torch.jit.trace(model, example, strict=False, check_trace=False)
+            except RuntimeError as e:
+                # Older torch (e.g. 2.0) has no CPU Half kernels for addmm/LayerNorm: upcast in place and retrace.
+                # The weights are already FP16-rounded; convert_traced() pins the mlprogram output to FP32 either way.
+                if "Half" not in str(e) or next(model.parameters()).dtype != torch.float16:
+                    raise
+                print("⚠️ This torch build cannot run FP16 on CPU; tracing with FP32 weights instead.")
+                model.float()
+                traced = torch.jit.trace(model, example, strict=False, check_trace=False)
     except Exception as e:
         print(f"❌ JIT trace failed: {e}")
         print("Try with Python 3.9–3.11 and torch 2.0–2.2.")
         sys.exit(1)
+    # Freeze: inline weights as constants and fold eval-only branches (dropout) so the converter sees a clean graph.
+    # Not optimize_for_inference: its MKLDNN rewrites emit ops the Core ML converter cannot lower.
+    try:
+        traced = torch.jit.freeze(traced)
+    except (AttributeError, RuntimeError) as e:
+        print(f"⚠️ torch.jit.freeze unavailable ({e}); converting the unfrozen trace.")
+    return traced
+
+
+# --pass-pipeline minimal: only the MIL passes this graph benefits from (no convs, so no conv/bn fusions).
+MINIMAL_PASSES = (
+    "common::const_elimination",
+    "common::dead_code_elimination",
+    "common::fuse_linear_bias",
+    "common::cast_optimization",
+)
+
 
-    print("Converting to Core ML (neuralnetwork = single file with embedded weights)...")
+# compute_precision=FLOAT16 only takes effect through add_fp16_cast, which EMPTY lacks: added back for mlprogram.
+FP16_PASSES = (
+    "common::add_fp16_cast",
+    "common::update_output_dtypes",
+)
+
+
+def pass_pipeline(args):
+    """ct.PassPipeline for --pass-pipeline: coremltools' DEFAULT, or MINIMAL_PASSES (plus FP16_PASSES for
+    mlprogram) on an empty pipeline."""
+    import coremltools as ct
+
+    if args.pass_pipeline == "default":
+        return ct.PassPipeline.DEFAULT
+    pipeline = ct.PassPipeline.EMPTY
+    # FP16 casts first so cast_optimization can fold the redundant ones they insert.
+    for pass_name in (() if args.nn else FP16_PASSES) + MINIMAL_PASSES:
+        pipeline.append_pass(pass_name)
+    return pipeline
+
+
+def token_inputs(shape):
+    """input_ids / attention_mask TensorTypes for the given (enumerated) shape."""
+    import coremltools as ct
+    import numpy as np
+
+    # Both inputs stay int32: Core ML multiarray I/O has no 8- or 16-bit integer type (int32, fp16, fp32, double only).
+    return [
+        ct.TensorType(name="input_ids", shape=shape, dtype=np.int32),
+        ct.TensorType(name="attention_mask", shape=shape, dtype=np.int32),
+    ]
+
+
+def convert_traced(traced, args, inputs, output_name="embedding"):
+    """ct.convert the traced model with the given ct.TensorType inputs, then apply --quantize. Exits on failure."""
+    import coremltools as ct
+    import numpy as np
+
+    if args.nn:
+        print("Converting to Core ML (neuralnetwork = single file with embedded weights, FP32)...")
+        convert_kwargs = dict(convert_to="neuralnetwork", minimum_deployment_target=ct.target.macOS11)
+    else:
+        print("Converting to Core ML (mlprogram, FP16 weights and compute)...")
+        convert_kwargs = dict(
+            convert_to="mlprogram",
+            minimum_deployment_target=ct.target.macOS13,
+            compute_precision=ct.precision.FLOAT16,
+            # Pin FP32 output: traced with FP16 weights, the inferred output dtype would otherwise be FP16, so the
+            # dtype would depend on whether the FP32 retrace in trace_model() ran.
+            outputs=[ct.TensorType(name=output_name, dtype=np.float32)],
+        )
     try:
         mlmodel = ct.convert(
             traced,
-            inputs=[
-                ct.TensorType(name="input_ids", shape=(1, MAX_LENGTH), dtype=np.int32),
-                ct.TensorType(name="attention_mask", shape=(1, MAX_LENGTH), dtype=np.int32),
-            ],
-            convert_to="neuralnetwork",
-            compute_units=ct.ComputeUnit.ALL,
-            minimum_deployment_target=ct.target.macOS11,
+            inputs=inputs,
+            compute_units=ct.ComputeUnit[args.compute_units.upper()],
+            pass_pipeline=pass_pipeline(args),
+            **convert_kwargs,
         )
     except Exception as e:
         print(f"❌ Core ML conversion failed: {e}")
@@ -104,12 +297,223 @@ def main():
         print("Alternatively, use a pre-converted EmbeddingModel.mlmodel from Hugging Face.")
         sys.exit(1)
 
-    # neuralnetwork format saves as .mlmodel (single file, weights embedded). Do not rename output (breaks NN backend).
-    os.makedirs(os.path.dirname(OUTPUT_MLMODEL), exist_ok=True)
-    mlmodel.save(OUTPUT_MLMODEL)
+    if args.quantize != "none":
+        print(f"Compressing weights ({args.quantize})...")
+        try:
+            mlmodel = compress_weights(mlmodel, args.quantize)
+        except Exception as e:
+            print(f"❌ Weight compression failed: {e}")
+            print("int4 palettization needs scikit-learn (pip install scikit-learn).")
+            sys.exit(1)
+    return mlmodel
+
+
+def convert_one(max_len, args):
+    """--split-buckets worker: trace and convert a fixed-length (batch, max_len) model in its own process. Returns the saved path."""
+    from transformers import AutoTokenizer
+
+    # main() has already downloaded the weights; workers only read the local Hugging Face cache.
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, local_files_only=True)
+    model = torch_modules().MiniLMEmbeddingModel(local_files_only=True, torch_dtype=load_dtype(args)).eval()
+    traced = trace_model(model, tokenizer, max_len)
+    mlmodel = convert_traced(traced, args, token_inputs(input_shapes([max_len], max_len)))
+    base = OUTPUT_MLMODEL if args.nn else OUTPUT_MLPACKAGE
+    stem, ext = os.path.splitext(base)
+    output_path = f"{stem}_{max_len}{ext}"
+    mlmodel.save(output_path)
+    return output_path
+
+
+def compile_model(mlmodel, model_path):
+    """Write EmbeddingModel.mlmodelc next to the saved model so the app skips compiling it on first launch.
+    Best effort: on failure the app still compiles the .mlpackage/.mlmodel at load time."""
+    if os.path.isdir(OUTPUT_MLMODELC):
+        # Always drop the old one: EmbeddingModel loads .mlmodelc first, so a stale copy would shadow the new model.
+        shutil.rmtree(OUTPUT_MLMODELC)
+    try:
+        shutil.copytree(mlmodel.get_compiled_model_path(), OUTPUT_MLMODELC)
+    except Exception:
+        # No loaded model to ask (non-macOS, older coremltools): fall back to Xcode's compiler.
+        try:
+            subprocess.run(
+                ["xcrun", "coremlcompiler", "compile", model_path, os.path.dirname(OUTPUT_MLMODELC)],
+                check=True,
+                stdout=subprocess.DEVNULL,
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"⚠️ Could not precompile {os.path.basename(model_path)} ({e}); the app will compile it on first load.")
+            return
+    print(f"✅ Saved compiled Core ML model to {OUTPUT_MLMODELC}")
+
+
+def export_multifunction(model, tokenizer, args):
+    """Save encode (ids -> hidden states) and mean_pool (hidden states -> embedding) as two functions of one
+    mlprogram, so apps can swap the pooling without loading the encoder weights twice. Exits on failure."""
+    import coremltools as ct
+    import numpy as np
+    import torch
+
+    if args.nn:
+        print("❌ --multifunction needs the mlprogram backend; drop --nn.")
+        sys.exit(1)
+    if not hasattr(ct.utils, "MultiFunctionDescriptor"):
+        print("❌ --multifunction needs coremltools>=8.0 (ct.utils.MultiFunctionDescriptor).")
+        print("pip install -r scripts/requirements-export-multifunction.txt")
+        sys.exit(1)
+
+    lengths = sequence_lengths(args.max_length)
+    default = DEFAULT_SEQUENCE_BUCKET if DEFAULT_SEQUENCE_BUCKET in lengths else lengths[0]
+    encoder = convert_traced(
+        trace_model(torch_modules().MiniLMEncoder(model.model).eval(), tokenizer, args.max_length),
+        args,
+        token_inputs(input_shapes(lengths, default)),
+        output_name="hidden_states",
+    )
+
+    print("Tracing mean pool...")
+    with torch.no_grad():
+        # FP32 to match the hidden_states input declared below; compute_precision still runs it in FP16.
+        hidden = torch.zeros(1, args.max_length, HIDDEN_SIZE, dtype=torch.float32)
+        mask = torch.ones(1, args.max_length, dtype=torch.int32)
+        pool_traced = torch.jit.trace(torch_modules().MeanPool().eval(), (hidden, mask), check_trace=False)
+    hidden_shape = ct.EnumeratedShapes(
+        shapes=[(b, n, HIDDEN_SIZE) for b in BATCH_BUCKETS for n in lengths],
+        default=(1, default, HIDDEN_SIZE),
+    )
+    pool = convert_traced(
+        pool_traced,
+        args,
+        [
+            ct.TensorType(name="hidden_states", shape=hidden_shape, dtype=np.float32),
+            ct.TensorType(name="attention_mask", shape=input_shapes(lengths, default), dtype=np.int32),
+        ],
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        encoder_path = os.path.join(tmp, "encode.mlpackage")
+        pool_path = os.path.join(tmp, "mean_pool.mlpackage")
+        encoder.save(encoder_path)
+        pool.save(pool_path)
+        desc = ct.utils.MultiFunctionDescriptor()
+        desc.add_function(encoder_path, src_function_name="main", target_function_name="encode")
+        desc.add_function(pool_path, src_function_name="main", target_function_name="mean_pool")
+        desc.default_function_name = "encode"
+        ct.utils.save_multifunction(desc, OUTPUT_MULTIFUNCTION)
+    print(f"✅ Saved multifunction Core ML model to {OUTPUT_MULTIFUNCTION} (functions: encode, mean_pool)")
+    print("Load a function with MLModelConfiguration.functionName (macOS 15+). The app keeps using EmbeddingModel.")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export all-MiniLM-L6-v2 to Core ML for KnowledgeCache.")
+    parser.add_argument(
+        "--quantize",
+        choices=("none", "int8", "int4"),
+        default="none",
+        help="Weight compression after conversion: int8 linear quantization or int4 k-means palettization.",
+    )
+    parser.add_argument(
+        "--max-length",
+        type=int,
+        default=MAX_LENGTH,
+        help=f"Longest sequence bucket (default {MAX_LENGTH}; must not exceed MiniLMTokenizer.maxLength in Swift).",
+    )
+    parser.add_argument(
+        "--nn",
+        action="store_true",
+        help="Legacy export: FP32 neuralnetwork .mlmodel (macOS 11+) instead of FP16 mlprogram .mlpackage.",
+    )
+    parser.add_argument(
+        "--load-fp32",
+        action="store_true",
+        help="Load and trace FP32 weights even for the FP16 mlprogram export. Torch builds without CPU Half "
+        "kernels fall back to this automatically; the flag just skips the failed FP16 attempt.",
+    )
+    parser.add_argument(
+        "--compute-units",
+        choices=("cpu_and_ne", "all", "cpu_and_gpu", "cpu_only"),
+        default="cpu_and_ne",
+        help="Compute units for the converted model (default cpu_and_ne keeps the encoder on the Neural Engine; "
+        "use all to allow GPU fallback).",
+    )
+    parser.add_argument(
+        "--pass-pipeline",
+        choices=("default", "minimal"),
+        default="default",
+        help="MIL graph passes during conversion: coremltools' full default set, or a minimal set "
+        "(FP16 casting for mlprogram, const elimination, linear-bias fusion, cast optimization) "
+        "for lower converter time and memory.",
+    )
+    parser.add_argument(
+        "--multifunction",
+        action="store_true",
+        help="Also export EmbeddingModelMultiFunction.mlpackage with separate encode and mean_pool functions "
+        "(needs scripts/requirements-export-multifunction.txt for coremltools>=8; macOS 15+ to load).",
+    )
+    parser.add_argument(
+        "--split-buckets",
+        action="store_true",
+        help="Instead of one enumerated-shape model, export one fixed-shape model per bucket "
+        "(EmbeddingModel_<L>), converted in parallel processes. These are not precompiled to .mlmodelc "
+        "and cannot be combined with --multifunction.",
+    )
+    args = parser.parse_args(argv)
+    if not 1 <= args.max_length <= MAX_POSITION_EMBEDDINGS:
+        parser.error(f"--max-length must be between 1 and {MAX_POSITION_EMBEDDINGS} (got {args.max_length})")
+    if args.split_buckets and args.multifunction:
+        parser.error("--split-buckets and --multifunction cannot be combined")
+    return args
+
+
+def main():
+    args = parse_args()
+    from transformers import AutoTokenizer
+
+    print("Loading tokenizer...")
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+
+    # Always export vocab first (needed for Swift MiniLMTokenizer)
+    export_vocab(tokenizer)
+
+    if args.split_buckets:
+        from huggingface_hub import snapshot_download
+
+        # Download once here; workers load from the local cache with local_files_only, so no model is built in
+        # this process. Tracing and conversion are CPU-bound and independent per bucket: wall time is the slowest.
+        # Only what AutoTokenizer/AutoModel read: the repo also ships onnx/, openvino/, TF, Rust and .bin weights.
+        snapshot_download(MODEL_NAME, allow_patterns=["*.json", "*.txt", "*.safetensors"])
+        lengths = sequence_lengths(args.max_length)
+        print(f"Converting {len(lengths)} bucket models in parallel: {lengths}")
+        with ProcessPoolExecutor(max_workers=len(lengths)) as ex:
+            paths = list(ex.map(convert_one, lengths, [args] * len(lengths)))
+        for path in paths:
+            print(f"✅ Saved Core ML model to {path}")
+        return
+
+    print("Loading model...")
+    model = torch_modules().MiniLMEmbeddingModel(torch_dtype=load_dtype(args)).eval()
+
+    if args.multifunction:
+        export_multifunction(model, tokenizer, args)
+
+    # Export Core ML model (trace -> convert)
+    traced = trace_model(model, tokenizer, args.max_length)
+    mlmodel = convert_traced(traced, args, token_inputs(sequence_shapes(args.max_length)))
+
+    # neuralnetwork saves as .mlmodel (single file, weights embedded; do not rename output, breaks NN backend);
+    # mlprogram saves as .mlpackage (weights in Data/). Remove the other format so the app does not load a stale model.
+    output_path, stale_path = (OUTPUT_MLMODEL, OUTPUT_MLPACKAGE) if args.nn else (OUTPUT_MLPACKAGE, OUTPUT_MLMODEL)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    mlmodel.save(output_path)
+    if os.path.isdir(stale_path):
+        shutil.rmtree(stale_path)
+        print(f"Removed stale {stale_path}")
+    elif os.path.isfile(stale_path):
+        os.remove(stale_path)
+        print(f"Removed stale {stale_path}")
     out_name = mlmodel.get_spec().description.output[0].name if mlmodel.get_spec().description.output else "?"
-    print(f"✅ Saved Core ML model to {OUTPUT_MLMODEL} (output name: {out_name})")
-    print("Add EmbeddingModel.mlmodel to your Xcode target (or use the post-build copy script).")
+    print(f"✅ Saved Core ML model to {output_path} (output name: {out_name})")
+    compile_model(mlmodel, output_path)
+    print(f"Add {os.path.basename(output_path)} to your Xcode target (or use the post-build copy script).")
 
 
 if __name__ == "__main__":
@@ -9,15 +9,38 @@ Usage:
 
 Requires: pip install -r requirements-langextract.txt
 Env: LANGEXTRACT_API_KEY (Gemini) or use model_id="gemma2:2b" with Ollama for local.
+     LX_TOKEN_BUDGET caps the text sent to the model (default 30000 tokens, estimated as 4 bytes/token).
 """
 
 import json
 import sys
 import textwrap
+from collections import defaultdict
+
+MAX_INPUT_CHARS = 200_000
+DEFAULT_TOKEN_BUDGET = 30_000
+BYTES_PER_TOKEN = 4
+
 
 def main() -> None:
-    raw = sys.stdin.read()
-    raw = raw.strip()
+    # Read one char past the cap instead of the whole stream: bounds peak memory on large pipes.
+    raw = sys.stdin.read(MAX_INPUT_CHARS + 1)
+    if len(raw) > MAX_INPUT_CHARS:
+        sys.stderr.write(f"extract_structured: input truncated to {MAX_INPUT_CHARS} chars\n")
+        # Producers (StructuredExtractor.swift) write the whole page in one blocking call and only then start
+        # their timeout: consume the rest without keeping it, so their write completes instead of hitting EPIPE.
+        while sys.stdin.read(1 << 16):
+            pass
+    raw = raw[:MAX_INPUT_CHARS].strip()
+    # The LLM bills and slows down per token, not per char: cut to an estimated token budget.
+    budget_bytes = __get_token_budget() * BYTES_PER_TOKEN
+    raw_bytes = raw.encode("utf-8")
+    if len(raw_bytes) > budget_bytes:
+        raw = raw_bytes[:budget_bytes].decode("utf-8", "ignore")
+        sys.stderr.write(
+            f"extract_structured: input truncated to ~{budget_bytes // BYTES_PER_TOKEN} tokens "
+            f"({budget_bytes} of {len(raw_bytes)} bytes)\n"
+        )
     if not raw:
         sys.stderr.write("extract_structured: no input\n")
         sys.exit(1)
@@ -59,7 +82,7 @@ def main() -> None:
 
     model_id = "gemini-2.5-flash"
     extract_kwargs = {
-        "text_or_documents": raw[:200_000],
+        "text_or_documents": raw,
         "prompt_description": prompt,
         "examples": examples,
         "model_id": model_id,
@@ -91,28 +114,45 @@ def __get_env_key() -> str:
     return (os.environ.get("LANGEXTRACT_API_KEY") or os.environ.get("GOOGLE_API_KEY") or "").strip()
 
 
+def __get_token_budget() -> int:
+    import os
+    try:
+        return max(1, int(os.environ.get("LX_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET)))
+    except ValueError:
+        return DEFAULT_TOKEN_BUDGET
+
+
+def _bullets(texts) -> str:
+    return "\n".join(map("- {}".format, texts))
+
+
 def flatten_extractions(result) -> str:
     """Turn AnnotatedDocument extractions into one structured text for chunking."""
-    if not hasattr(result, "extractions") or not result.extractions:
+    extractions = getattr(result, "extractions", None) or ()
+    if not extractions:
         return ""
-    by_class = {}
-    for e in result.extractions:
-        cls = getattr(e, "extraction_class", "fact")
-        text = getattr(e, "extraction_text", str(e)).strip()
+    by_class = defaultdict(list)
+    for e in extractions:
+        # lx.data.Extraction always defines both fields; anything else is skipped rather than probed per item.
+        try:
+            text = e.extraction_text.strip()
+            cls = e.extraction_class
+        except AttributeError:
+            continue
         if not text:
             continue
-        by_class.setdefault(cls, []).append(text)
+        by_class[cls].append(text)
     parts = []
     if by_class.get("summary"):
         parts.append("Summary:\n" + "\n".join(by_class["summary"]))
     if by_class.get("key_point"):
-        parts.append("Key points:\n" + "\n".join("- " + t for t in by_class["key_point"]))
+        parts.append("Key points:\n" + _bullets(by_class["key_point"]))
     if by_class.get("fact"):
-        parts.append("Facts:\n" + "\n".join("- " + t for t in by_class["fact"]))
+        parts.append("Facts:\n" + _bullets(by_class["fact"]))
     for cls, texts in sorted(by_class.items()):
         if cls in ("summary", "key_point", "fact"):
             continue
-        parts.append(f"{cls.replace('_', ' ').title()}:\n" + "\n".join("- " + t for t in texts))
+        parts.append(f"{cls.replace('_', ' ').title()}:\n" + _bullets(texts))
     return "\n\n".join(parts) if parts else ""
 
 if __name__ == "__main__":